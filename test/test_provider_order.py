@@ -0,0 +1,35 @@
+"""Build orders for test/provider-order, run with python -m unittest."""
+
+import os
+import unittest
+
+import yamake
+
+BUILD_FILE = os.path.join(os.path.dirname(__file__), "provider-order", "yamake.yaml")
+
+
+def Order(*lNames):
+    """Return the names of the targets a build of lNames lays down, in order."""
+    builder = yamake.Builder()
+    builder.use_cache = False
+    dProviders = builder.Initialize(BUILD_FILE)
+    result, lQueueSet, lAmbiguous, lEssentials, lFullProvides = builder.Enqueue(
+        [builder.index[sName] for sName in lNames], dProviders
+    )
+    return [t.name for t in builder.OrderByDepends(lQueueSet, lEssentials)]
+
+
+class OrderByDependsTest(unittest.TestCase):
+    def testProviderOutsideLoop(self):
+        self.assertEqual(Order("a", "c"), ["c", "b", "a"])
+
+    def testAbstractDependsComeFirst(self):
+        self.assertEqual(Order("x"), ["z", "y", "x"])
+
+    def testLoopNoProviderBreaks(self):
+        with self.assertRaisesRegex(SyntaxError, r"CYCLIC BUILD ORDER \[p, q\]"):
+            Order("p")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,13 +10,11 @@ Please see the project's github at https://github.com/drollings/yamake for detai
 """
 
 import os
-import codecs
-import yaml
 import sys
-from itertools import chain
 
-from pprint import pformat
+from operator import attrgetter
 from collections import defaultdict
+from graphlib import CycleError, TopologicalSorter
 
 _extra_doc = """
 A simple make/build system around layer directories and git meant to operate
@@ -39,22 +37,51 @@ The repo folder should contain a git repository from which layers can be
 built when needed.
 """
 
-RED = "\033[1;31m"
-GRN = "\033[1;32m"
-YEL = "\033[1;33m"
-BLU = "\033[1;34m"
-MAG = "\033[0;35m"
-CYN = "\033[0;36m"
-WHI = "\033[1;37m"
-NRM = "\033[0m"
-
-ERROR = "[%sERROR%s]" % (RED, NRM)
-WARNING = "[%sWARNING%s]" % (YEL, NRM)
-SUCCESS = "[%sSUCCESS%s]" % (GRN, NRM)
-DEBUG = "[%sDEBUG%s]" % (MAG, NRM)
-INFO = "[%sINFO%s]" % (BLU, NRM)
-EXEC = "[%sEXEC%s]" % (CYN, NRM)
-START = "[%sSTART%s]" % (WHI, NRM)
+# Color codes and status prefixes, all set by SetColor below.
+RED = GRN = YEL = BLU = MAG = CYN = WHI = NRM = ""
+ERROR = WARNING = SUCCESS = DEBUG = INFO = EXEC = START = ""
+
+# Columns a prefix's escapes take up, which padding widths must allow for.
+ESCAPES = 0
+
+
+def SetColor(bColor):
+    """Set the color codes and status prefixes, with or without ANSI escapes.
+
+    Args:
+        bColor (bool): Whether to emit color escape sequences.
+    """
+    global RED, GRN, YEL, BLU, MAG, CYN, WHI, NRM
+    global ERROR, WARNING, SUCCESS, DEBUG, INFO, EXEC, START, ESCAPES
+
+    if bColor:
+        RED = "\033[1;31m"
+        GRN = "\033[1;32m"
+        YEL = "\033[1;33m"
+        BLU = "\033[1;34m"
+        MAG = "\033[0;35m"
+        CYN = "\033[0;36m"
+        WHI = "\033[1;37m"
+        NRM = "\033[0m"
+    else:
+        RED = GRN = YEL = BLU = MAG = CYN = WHI = NRM = ""
+
+    ERROR = "[%sERROR%s]" % (RED, NRM)
+    WARNING = "[%sWARNING%s]" % (YEL, NRM)
+    SUCCESS = "[%sSUCCESS%s]" % (GRN, NRM)
+    DEBUG = "[%sDEBUG%s]" % (MAG, NRM)
+    INFO = "[%sINFO%s]" % (BLU, NRM)
+    EXEC = "[%sEXEC%s]" % (CYN, NRM)
+    START = "[%sSTART%s]" % (WHI, NRM)
+    ESCAPES = len(RED + NRM)
+
+
+# Color only when writing to a terminal, and honor https://no-color.org.
+# sys.stdout is None under pythonw and some embedders.
+SetColor(
+    bool(getattr(sys.stdout, "isatty", None) and sys.stdout.isatty())
+    and not os.environ.get("NO_COLOR")
+)
 
 DIVIDER = (
     "------------------------------------------------------------------------------"
@@ -67,6 +94,193 @@ SPACES = (
 )
 
 
+# Parsed YAML and cached build plans live here.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yamake")
+
+
+def ReadCache(sCacheFile, key):
+    """Load a pickled value written by WriteCache.
+
+    Args:
+        sCacheFile (str): The cache file to read.
+        key: The key the value must have been stored under.
+
+    Returns:
+        The cached value, or None if the file is missing, unreadable or stale.
+    """
+    import pickle
+
+    # A corrupt or foreign pickle can raise nearly anything, and any failure
+    # is only a cache miss.
+    try:
+        with open(sCacheFile, "rb") as cache_file:
+            cachedKey, value = pickle.load(cache_file)
+    except Exception:
+        return None
+
+    if cachedKey != key:
+        return None
+    return value
+
+
+def WriteCache(sCacheFile, key, value):
+    """Atomically pickle value under key to sCacheFile, best effort.
+
+    Args:
+        sCacheFile (str): The cache file to write.
+        key: The key ReadCache will check against.
+        value: The value to store.
+    """
+    import pickle
+
+    sTempFile = "%s.%d" % (sCacheFile, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(sCacheFile) or ".", exist_ok=True)
+        with open(sTempFile, "wb") as cache_file:
+            pickle.dump((key, value), cache_file, protocol=5)
+        os.replace(sTempFile, sCacheFile)
+    except (OSError, RecursionError, pickle.PicklingError):
+        if os.path.exists(sTempFile):
+            os.remove(sTempFile)
+
+
+def ReadPlan(sPlanFile, key):
+    """Load a build plan written by WritePlan.
+
+    Args:
+        sPlanFile (str): The JSON plan file to read.
+        key (list): The key the plan must have been stored under.
+
+    Returns:
+        tuple or None: (result, lOutput) as returned by PlanBuild, or None if missing or stale.
+    """
+    import json
+
+    try:
+        with open(sPlanFile, "r", encoding="utf-8") as plan_file:
+            dPlan = json.load(plan_file)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(dPlan, dict) or dPlan.get("key") != key:
+        return None
+    return dPlan["result"], dPlan["output"]
+
+
+def WritePlan(sPlanFile, key, result, lOutput):
+    """Atomically store a build plan as JSON, best effort.
+
+    Args:
+        sPlanFile (str): The JSON plan file to write.
+        key (list): The key ReadPlan will check against.
+        result (bool): Whether the plan resolved.
+        lOutput (list): The output lines of the plan.
+    """
+    import json
+
+    sTempFile = "%s.%d" % (sPlanFile, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(sPlanFile), exist_ok=True)
+        with open(sTempFile, "w", encoding="utf-8") as plan_file:
+            json.dump({"key": key, "result": result, "output": lOutput}, plan_file)
+        os.replace(sTempFile, sPlanFile)
+    except OSError:
+        if os.path.exists(sTempFile):
+            os.remove(sTempFile)
+
+
+def ReadFile(sPath):
+    """Read a whole file as bytes, without the buffered text I/O layers.
+
+    Args:
+        sPath (str): The file to read.
+
+    Returns:
+        bytes: The file contents.
+    """
+    fd = os.open(sPath, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+    try:
+        # One read normally suffices, but reads may come up short (NFS, FUSE)
+        # or the file may grow meanwhile, so only an empty read means EOF.
+        iSize = os.fstat(fd).st_size + 1
+        lChunks = []
+        while True:
+            chunk = os.read(fd, iSize)
+            if not chunk:
+                break
+            lChunks.append(chunk)
+        return b"".join(lChunks)
+    finally:
+        os.close(fd)
+
+
+def LoadYAML(sPath, bCache=True):
+    """Parse a YAML file, reusing a pickled copy while the file is unchanged.
+
+    Parsed documents are cached under ~/.cache/yamake, keyed by the file's
+    absolute path, mtime and size.
+
+    Args:
+        sPath (str): The YAML file to load.
+        bCache (bool, optional): Whether to read and write the cache. Defaults to True.
+
+    Returns:
+        The parsed document.
+    """
+    from hashlib import sha1
+
+    sAbsPath = os.path.abspath(sPath)
+    if bCache:
+        st = os.stat(sAbsPath)
+        key = (sAbsPath, st.st_mtime_ns, st.st_size)
+        sCacheFile = os.path.join(
+            CACHE_DIR, "%s.pkl" % sha1(sAbsPath.encode("utf-8")).hexdigest()
+        )
+        dLoad = ReadCache(sCacheFile, key)
+        if dLoad is not None:
+            return dLoad
+
+    # PyYAML is only needed on a cache miss.  Prefer the libyaml scanner when
+    # PyYAML was built with it.
+    import yaml
+
+    Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    dLoad = yaml.load(ReadFile(sAbsPath), Loader=Loader)
+    if bCache:
+        WriteCache(sCacheFile, key, dLoad)
+    return dLoad
+
+
+def LoadPlugin(sPluginFile):
+    """Import a plugin straight from its file, without searching sys.path.
+
+    Args:
+        sPluginFile (str): The plugin's .py file.
+
+    Returns:
+        module: The plugin module, reused if this file was already loaded.
+    """
+    from importlib.util import module_from_spec, spec_from_file_location
+
+    # A private name, so a plugin never replaces a module of the same name.
+    sName = "yamake_plugin_" + os.path.splitext(os.path.basename(sPluginFile))[0]
+    plugin = sys.modules.get(sName)
+    if plugin is not None and getattr(plugin, "__file__", None) == sPluginFile:
+        return plugin
+
+    spec = spec_from_file_location(sName, sPluginFile)
+    if spec is None:
+        raise ImportError("Can not load plugin %s" % sPluginFile, path=sPluginFile)
+    plugin = module_from_spec(spec)
+    sys.modules[sName] = plugin
+    try:
+        spec.loader.exec_module(plugin)
+    except BaseException:
+        del sys.modules[sName]
+        raise
+    return plugin
+
+
 def lsset(s):
     """Return a sorted string representation of the set s.
 
@@ -76,9 +290,66 @@ def lsset(s):
     Returns:
         str: A space-separated, sorted string representing the elements of the set.
     """
-    l = [repr(i) for i in s]
-    l.sort()
-    return " ".join(l)
+    return " ".join(sorted(map(repr, s)))
+
+
+def FindCycles(lNodes, getEdges):
+    """Find the cycles in the graph formed by each node's outgoing edges.
+
+    This is an iterative Tarjan strongly connected components pass, so every node
+    and edge is visited once regardless of the depth of the graph.
+
+    Args:
+        lNodes (iterable): The nodes of the graph.
+        getEdges (callable): Returns a node's outgoing edges, or None for none.
+
+    Returns:
+        list: A list of cycles, each a list of the nodes taking part in it.
+    """
+    dIndex = {}
+    dLowLink = {}
+    lStack = []
+    lOnStack = set()
+    lCycles = []
+
+    for root in lNodes:
+        if root in dIndex:
+            continue
+
+        dIndex[root] = dLowLink[root] = len(dIndex)
+        lStack.append(root)
+        lOnStack.add(root)
+        lWork = [(root, iter(getEdges(root) or ()))]
+
+        while lWork:
+            node, children = lWork[-1]
+            for child in children:
+                if child not in dIndex:
+                    dIndex[child] = dLowLink[child] = len(dIndex)
+                    lStack.append(child)
+                    lOnStack.add(child)
+                    lWork.append((child, iter(getEdges(child) or ())))
+                    break
+                if child in lOnStack:
+                    dLowLink[node] = min(dLowLink[node], dIndex[child])
+            else:
+                lWork.pop()
+                if lWork:
+                    parent = lWork[-1][0]
+                    dLowLink[parent] = min(dLowLink[parent], dLowLink[node])
+
+                if dLowLink[node] == dIndex[node]:
+                    lComponent = []
+                    while True:
+                        member = lStack.pop()
+                        lOnStack.discard(member)
+                        lComponent.append(member)
+                        if member is node:
+                            break
+                    if len(lComponent) > 1 or node in (getEdges(node) or ()):
+                        lCycles.append(lComponent)
+
+    return lCycles
 
 
 ############################################################
@@ -87,6 +358,15 @@ def lsset(s):
 ############################################################
 
 
+# Initialized build state is pickled under CACHE_DIR, one file per build file.
+# Targets are stored flat, with these relations as lists of names.
+CACHED_RELATIONS = ("depends", "provides", "_abstract_depends", "_nonabstract_depends")
+
+
+# Shared by every target with no depends or provides.
+_EMPTY = frozenset()
+
+
 class Builder:
     def __init__(self):
         self.lTargets = []
@@ -94,138 +374,240 @@ class Builder:
         self.config = {}
         self.baseFamily = None
         self.lEssentials = set()
-        self.dEssentialsToFamilies = defaultdict(Target, {})
+        self.dEssentialsToFamilies = {}
+        self.dProviders = {}
+        self.dFullProviders = {}
+        self.lEssentialProviders = _EMPTY
+        self.bPlainGraph = False
         self.config = None
+        self.sConfigFile = None
         self.plugin = None
         self.debug_output = False
+        self.use_cache = True
 
     def _initConfig(self, sConfigFile=None):
-        """Initialize builds from a build file and optional configuration file.
+        """Load the first configuration file found, and its plugin if any.
 
         Args:
-            sBuildFile (str): The path to the build file.
-            sConfigFile (str, optional): Path to an optional config file. Defaults to None.
+            sConfigFile (str, optional): Path to a config file to try first. Defaults to None.
 
         Returns:
-            dict: A dictionary of full providers keyed by target.
-
-        Raises:
-            SyntaxError: If there is a cyclic dependency or provide in the build file.
+            Builder: self.
         """
-        for i in (
+        lCandidates = (
             sConfigFile,
             "yamake-config.yaml",
             "%s/.config/yamake-config.yaml" % (os.path.expanduser("~")),
-        ):
-            if i and os.path.exists(i):
-                with codecs.open(sConfigFile, "r", "utf_8") as config_file:
-                    self.config = yaml.safe_load(config_file)
-
-                ############################################################
-                # Now this gets interesting!  We're going to let YAML files
-                # specify a Python plugin to load with hooks for task-specific
-                # logic, if anything beyond the basics is required.
-                # This build system just got super-extensible.
-                ############################################################
-
-                if "PLUGIN" in self.config:
-                    sPlugin = self.config["PLUGIN"]
-
-                    # TODO:  platform-independent determination of other paths
+        )
+        sPath = next((i for i in lCandidates if i and os.path.exists(i)), None)
+        if not sPath:
+            return self
+
+        self.sConfigFile = sPath
+        self.config = LoadYAML(sPath, self.use_cache)
+
+        ############################################################
+        # Now this gets interesting!  We're going to let YAML files
+        # specify a Python plugin to load with hooks for task-specific
+        # logic, if anything beyond the basics is required.
+        # This build system just got super-extensible.
+        ############################################################
+
+        if "PLUGIN" in self.config:
+            sPlugin = self.config["PLUGIN"]
+
+            # A plugin given as a file is found relative to the config file.
+            if sPlugin.endswith(".py"):
+                sPluginFile = os.path.join(
+                    os.path.dirname(os.path.abspath(sPath)),
+                    os.path.expanduser(sPlugin),
+                )
+                self.plugin = LoadPlugin(sPluginFile)
+                return self
+
+            # A plugin already imported in this process is reused as is.
+            # Like __import__, a dotted name yields its top-level package.
+            self.plugin = None
+            if sPlugin in sys.modules:
+                self.plugin = sys.modules.get(sPlugin.partition(".")[0])
+            if self.plugin is None:
+                # TODO:  platform-independent determination of other paths
+                if "." not in sys.path:
                     sys.path.append(".")
-                    self.plugin = __import__(sPlugin)
+                self.plugin = __import__(sPlugin)
 
         return self
 
+    def _cacheKey(self, sBuildFile, sConfigFile=None):
+        """Key a cached build state on the build, config and yamake.py files.
+
+        Args:
+            sBuildFile (str): The path to the build file.
+            sConfigFile (str, optional): Path to an optional config file.
+
+        Returns:
+            tuple: The cache key.
+        """
+        # yamake.py and the interpreter are part of the key, since they
+        # define what is pickled.
+        st = os.stat(sBuildFile)
+        lKey = [
+            os.path.abspath(sBuildFile),
+            st.st_mtime_ns,
+            st.st_size,
+            os.stat(__file__).st_mtime_ns,
+            "%d.%d" % sys.version_info[:2],
+        ]
+        if sConfigFile and os.path.exists(sConfigFile):
+            stConfig = os.stat(sConfigFile)
+            lKey += [
+                os.path.abspath(sConfigFile),
+                stConfig.st_mtime_ns,
+                stConfig.st_size,
+            ]
+        else:
+            lKey += [None, 0, 0]
+        return tuple(lKey)
+
+    def _loadCache(self, sCacheFile, key):
+        """Restore a previously initialized build state, if still valid.
+
+        Returns:
+            bool: True if the state was restored from sCacheFile.
+        """
+        lState = ReadCache(sCacheFile, key)
+        if lState is None:
+            return False
+
+        (
+            lTargets,
+            lEssentials,
+            dEssentialsToFamilies,
+            dProviders,
+            dFullProviders,
+            lEssentialProviders,
+            self.bPlainGraph,
+        ) = lState
+
+        for dTarget in lTargets:
+            Target(dTarget.pop("name"), self, dTarget)
+
+        index = self.index
+        for t in self.lTargets:
+            for sAttr in CACHED_RELATIONS:
+                lNames = getattr(t, sAttr)
+                setattr(t, sAttr, frozenset([index[s] for s in lNames]) or _EMPTY)
+
+        self.lEssentials = {index[s] for s in lEssentials}
+        self.dEssentialsToFamilies = {
+            index[s]: index[sFamily] for s, sFamily in dEssentialsToFamilies.items()
+        }
+        self.dProviders = {
+            index[s]: {index[sp] for sp in lNames} for s, lNames in dProviders.items()
+        }
+        self.dFullProviders = {
+            index[s]: {index[sp] for sp in lNames}
+            for s, lNames in dFullProviders.items()
+        }
+        self.lEssentialProviders = frozenset([index[s] for s in lEssentialProviders])
+        return True
+
+    def _saveCache(self, sCacheFile, key):
+        """Write the initialized build state to sCacheFile, best effort.
+
+        Targets are referred to by name throughout, so pickle never recurses
+        down the graph and the file does not depend on where Target lives.
+        """
+        lTargets = []
+        for t in self.lTargets:
+            dTarget = dict(t.__dict__)
+            for sAttr in CACHED_RELATIONS:
+                dTarget[sAttr] = [d.name for d in dTarget[sAttr]]
+            lTargets.append(dTarget)
+
+        lState = [
+            lTargets,
+            [t.name for t in self.lEssentials],
+            {t.name: f.name for t, f in self.dEssentialsToFamilies.items()},
+            {t.name: [p.name for p in l] for t, l in self.dProviders.items()},
+            {t.name: [p.name for p in l] for t, l in self.dFullProviders.items()},
+            [t.name for t in self.lEssentialProviders],
+            self.bPlainGraph,
+        ]
+        WriteCache(sCacheFile, key, lState)
+
     def Initialize(self, sBuildFile, sConfigFile=None):
         if sConfigFile:
             self._initConfig(sConfigFile)
 
+        # Plugins may rewrite targets at load time, so only plain builds
+        # are safe to restore from the on-disk cache.
+        bCache = self.use_cache and not self.plugin
+        if bCache:
+            from hashlib import sha1
+
+            cacheKey = self._cacheKey(sBuildFile, self.sConfigFile)
+            sCacheFile = os.path.join(
+                CACHE_DIR,
+                "state",
+                "%s.pkl" % sha1(cacheKey[0].encode("utf-8")).hexdigest(),
+            )
+            if self._loadCache(sCacheFile, cacheKey):
+                return self.dFullProviders
+
         # First we read in the explicit definitions
-        with codecs.open(sBuildFile, "r", "utf_8") as build_file:
-            input_str = "".join(build_file.readlines())
-            dLoad = yaml.safe_load(input_str)
+        dLoad = LoadYAML(sBuildFile, self.use_cache)
 
-            for key, value in dLoad.items():
-                Target(key, self, value)
+        for key, value in dLoad.items():
+            Target(key, self, value)
 
         if self.plugin and "pluginInitialize" in self.plugin.__dict__:
             dReturn = self.plugin.pluginInitialize(self)
             for key, value in dReturn.items():
                 Target(key, self, value)
-            l = self.lTargets
-            l.sort()
+            self.lTargets.sort(key=attrgetter("name"))
 
         self.lEssentials = set([t for t in self.lTargets if t.essential])
 
-        [t.FinalizeInit(self) for t in self.lTargets]
+        for t in self.lTargets:
+            t.FinalizeInit(self)
 
         if self.plugin and "pluginTargetFinalize" in self.plugin.__dict__:
             self.plugin.pluginTargetFinalize(Target)
 
-        dProviders = defaultdict(set)
+        # The plugin may have replaced Target.IsAbstract, so only cache the
+        # answers once its hooks have run.
+        for t in self.lTargets:
+            t.is_abstract = t.IsAbstract()
+        for t in self.lTargets:
+            t._abstract_depends = frozenset(d for d in t.depends if d.is_abstract)
+            t._nonabstract_depends = t.depends - t._abstract_depends
+
+        dProviders = {}
 
         for t in self.lTargets:
-            # Check for any cyclic dependencies
-            lDepends = t.depends
-            counter = 1
-            while lDepends:
-                if t in lDepends:
-                    raise SyntaxError(
-                        "CYCLIC DEPENDENCY %s, %s" % (t, lDepends)
-                    ).with_traceback(sys.exc_info()[2])
-                lastDepends = lDepends
-                lDepends = [dep.depends for dep in lDepends if dep.depends]
-                lDepends = list(set(list(chain.from_iterable(lDepends))))
-                counter += 1
-                if counter >= 10 or lDepends == lastDepends:
-                    raise SyntaxError("CYCLIC DEPENDENCY").with_traceback(
-                        sys.exc_info()[2]
-                    )
+            for provider in t.provides:
+                dProviders.setdefault(provider, set()).add(t)
 
-            # Check for any cyclic provision
-            lProvides = t.provides
-            if lProvides:
-                for provider in lProvides:
-                    dProviders[provider].add(t)
-
-            while lProvides:
-                if t in lProvides:
-                    raise SyntaxError(
-                        "CYCLIC PROVIDE %s, %s" % (t, lProvides)
-                    ).with_traceback(sys.exc_info()[2])
-                lastProvides = lProvides
-                lProvides = [p.provides for p in lProvides if p.provides]
-                lProvides = list(set(list(chain.from_iterable(lProvides))))
-                if lProvides == lastProvides:
-                    raise SyntaxError("CYCLIC PROVIDE").with_traceback(
-                        sys.exc_info()[2]
-                    )
+        # Any strongly connected component in either graph is a cycle.
+        lCycles = FindCycles(self.lTargets, attrgetter("depends"))
+        if lCycles:
+            raise SyntaxError("CYCLIC DEPENDENCY %s" % sorted(lCycles[0]))
 
-        dFullProviders = {}
+        lCycles = FindCycles(self.lTargets, attrgetter("provides"))
+        if lCycles:
+            raise SyntaxError("CYCLIC PROVIDE %s" % sorted(lCycles[0]))
 
-        # Now set the full depth of provides
-        for target, lProviders in dProviders.items():
-            lNewSet = set()
-            lNewSet |= lProviders
-            lP = set(
-                list(
-                    chain.from_iterable(
-                        [dProviders[p] for p in lNewSet if p in dProviders]
-                    )
-                )
-            )
-            lP -= lNewSet
-            while lP:
-                lNewSet |= lP
-                lP = set(
-                    list(
-                        chain.from_iterable(
-                            [dProviders[p] for p in lNewSet if p in dProviders]
-                        )
-                    )
-                )
-                lP -= lNewSet
+        # Now set the full depth of provides.  Providers sort ahead of what
+        # they provide, so each closure is built from finished closures.
+        dFullProviders = {}
+        for target in TopologicalSorter(dProviders).static_order():
+            lProviders = dProviders.get(target)
+            if lProviders is None:
+                continue
+            lNewSet = set(lProviders)
+            for p in lProviders:
+                lNewSet |= dFullProviders.get(p, _EMPTY)
             dFullProviders[target] = lNewSet
 
         # Create a dictionary mapping essentials to families
@@ -233,16 +615,29 @@ class Builder:
         lEssentials = self.lEssentials
         for b in lEssentials:
             baseFamily = b
-            lProvidedEssentials = None
-            if b.provides:
-                lProvidedEssentials = [t for t in b.provides if t in lEssentials]
+            lProvidedEssentials = b.provides & lEssentials
             while lProvidedEssentials:
-                baseFamily = lProvidedEssentials[0]
-                lProvidedEssentials = [
-                    t for t in baseFamily.Provides() if t in lEssentials
-                ]
+                baseFamily = min(lProvidedEssentials)
+                lProvidedEssentials = baseFamily.provides & lEssentials
             dEssentialsToFamilies[b] = baseFamily
 
+        # Keep both provider maps so later queries on this builder reuse them.
+        self.dProviders = dProviders
+        self.dFullProviders = dFullProviders
+
+        # Everything that can stand in for an essential, for Enqueue.
+        self.lEssentialProviders = frozenset().union(
+            *[dFullProviders.get(e, ()) for e in lEssentials]
+        )
+
+        # With no abstracts and no provides, Enqueue has nothing to choose.
+        self.bPlainGraph = not dProviders and not any(
+            t.is_abstract for t in self.lTargets
+        )
+
+        if bCache:
+            self._saveCache(sCacheFile, cacheKey)
+
         return dFullProviders
 
     def JSONOutput(self):
@@ -250,12 +645,10 @@ class Builder:
         Generates a JSON representation of the targets in the system. This includes information about dependencies, provides, actions etc.
 
         Returns:
-            str: A string containing a JSON object with target details.
+            list: The lines of a JSON object with target details, keyed by target name.
         """
         import json
 
-        lOutput = ["{"]
-
         # A list of attributes that we want to save for each target, used when dumping the data into JSON format.
         lSaved = (
             "exists",
@@ -263,19 +656,93 @@ class Builder:
             "depends",
             "provides",
             "clean",
-            "actions",
             "essential",
             "check_mtime",
         )
 
+        dOutput = {}
         for target in self.lTargets:
-            # Create a dictionary for each target, but only including keys whose values are non-empty and exist in lSaved.
-            d = {k: v for (k, v) in target.__dict__.items() if k in lSaved and v}
-            lOutput.append('\t"%s": %s' % (target.name, json.dumps(d)))
+            # Only keep keys whose values are non-empty and exist in lSaved; target sets become sorted names.
+            d = {}
+            for k, v in target.__dict__.items():
+                if k in lSaved and v:
+                    if isinstance(v, (set, frozenset)):
+                        v = sorted(t.name for t in v)
+                    d[k] = v
+            dOutput[target.name] = d
+
+        return json.dumps(dOutput, indent="\t").splitlines()
+
+    def Reachable(self, lTargets):
+        """
+        Collects every target reachable from lTargets through depends, provides, or
+        the known providers of a reached target.
 
-        # Add a right curly bracket '}' to end the JSON output.
-        lOutput.append("}")
-        return lOutput
+        Parameters:
+            - lTargets (iterable): The targets to start from.
+
+        Returns:
+            set: The reachable targets, including lTargets themselves.
+        """
+        dFullProviders = self.dFullProviders
+        lReachable = set()
+        lStack = list(lTargets)
+        while lStack:
+            t = lStack.pop()
+            if t in lReachable:
+                continue
+            lReachable.add(t)
+            if t.depends:
+                lStack.extend(t.depends)
+            if t.provides:
+                lStack.extend(t.provides)
+            if t in dFullProviders:
+                lStack.extend(dFullProviders[t])
+        return lReachable
+
+    def CheckTimeStamps(self, lTargets):
+        """
+        Checks the timestamps of lTargets. Targets sharing a directory are resolved
+        from a single os.scandir of it, rather than a stat per target, and separate
+        directories are checked concurrently since stat calls release the GIL.
+
+        Parameters:
+            - lTargets (iterable): The targets to check.
+        """
+        dByDir = defaultdict(list)
+        for t in lTargets:
+            if t.exists and not t.mtime:
+                sDir, sName = os.path.split(t._resolved)
+                dByDir[sDir].append((t, sName))
+
+        def checkDir(sDir, lEntries):
+            dEntries = None
+            if len(lEntries) > 1:
+                try:
+                    with os.scandir(sDir or ".") as it:
+                        dEntries = {entry.name: entry for entry in it}
+                except OSError:
+                    pass
+
+            for t, sName in lEntries:
+                if dEntries is None or not sName:
+                    t.CheckTimeStamp()
+                elif sName in dEntries:
+                    try:
+                        st = dEntries[sName].stat()
+                    except OSError:
+                        continue
+                    t.mtime = st.st_mtime if t.check_mtime else 1.0
+
+        # Every target lives in exactly one directory, so workers never share a target.
+        if len(dByDir) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(16, len(dByDir))) as executor:
+                list(executor.map(checkDir, dByDir.keys(), dByDir.values()))
+        else:
+            for sDir, lEntries in dByDir.items():
+                checkDir(sDir, lEntries)
 
     def OrderByDepends(self, lQueueSet, lEssentials, debug_output=False):
         """
@@ -289,104 +756,113 @@ class Builder:
         Returns:
             list: A list of ordered target objects by their dependencies and provides.
         """
-        lDepths = [list(set([t for t in lQueueSet & lEssentials if not t.depends]))]
-        lDepths.append(list(set([t for t in lQueueSet & lEssentials if t.depends])))
-        lProvides = lQueueSet & lEssentials
-        lProvides |= set(
-            list(chain.from_iterable([t.provides for t in lProvides if t.provides]))
-        )
-        lDepends = lQueueSet - lProvides
+        lQueuedEssentials = lQueueSet & lEssentials
+        byName = attrgetter("name")
+        lDepths = [sorted([t for t in lQueuedEssentials if not t.depends], key=byName)]
+        lDepths.append(sorted([t for t in lQueuedEssentials if t.depends], key=byName))
+
+        # Essentials are laid down first, so they and all they provide are done.
+        lDone = set()
+        lStack = list(lQueuedEssentials)
+        while lStack:
+            t = lStack.pop()
+            if t not in lDone:
+                lDone.add(t)
+                lStack.extend(t.provides)
+        lNodes = lQueueSet - lDone
+
+        # Every other target waits on each queued depend (lHard), else on the
+        # queued providers of the depend (one set in lGroups), else for an
+        # abstract depend on whatever its own depends wait on (lSoft).
+        dFullProviders = self.dFullProviders
+        dWaits = {}
+        dEdges = {}
+        for t in lNodes:
+            lHard = set()
+            lGroups = []
+            lSoft = set()
+            lStack = []
+            for d in t.depends:
+                if d in lDone:
+                    continue
+                if d in lNodes:
+                    lHard.add(d)
+                    continue
+                lProviders = lNodes & dFullProviders.get(d, _EMPTY)
+                lProviders.discard(t)
+                if lProviders:
+                    lGroups.append(lProviders)
+                elif d.is_abstract:
+                    lStack.extend(d.depends)
+
+            lSeen = set(t.depends)
+            while lStack:
+                d = lStack.pop()
+                if d in lDone or d in lSeen:
+                    continue
+                lSeen.add(d)
+                if d in lNodes:
+                    lSoft.add(d)
+                    continue
+                lProviders = lNodes & dFullProviders.get(d, _EMPTY)
+                if lProviders:
+                    lSoft |= lProviders
+                elif d.is_abstract:
+                    lStack.extend(d.depends)
+            lSoft.discard(t)
+
+            dWaits[t] = (lHard, lGroups, lSoft)
+            dEdges[t] = lHard.union(lSoft, *lGroups)
+
+        # A wait that closes a loop back through its target is dropped, unless
+        # it is on a queued depend or on the only providers left for a depend.
+        dLoops = {}
+        for lCycle in FindCycles(lNodes, dEdges.get):
+            lLoop = frozenset(lCycle)
+            for t in lCycle:
+                dLoops[t] = lLoop
+
+        # Added in name order, so a CycleError always reports the same loop.
+        sorter = TopologicalSorter()
+        for t in sorted(lNodes, key=byName):
+            lHard, lGroups, lSoft = dWaits[t]
+            lLoop = dLoops.get(t)
+            if lLoop is None:
+                lBefore = dEdges[t]
+            else:
+                lBefore = lHard | (lSoft - lLoop)
+                for lProviders in lGroups:
+                    lBefore |= (lProviders - lLoop) or lProviders
+            sorter.add(t, *sorted(lBefore, key=byName))
+
+        try:
+            sorter.prepare()
+        except CycleError as e:
+            raise SyntaxError("CYCLIC BUILD ORDER %s" % sorted(set(e.args[1])))
+
+        # Each get_ready() batch becomes one layer.
+        while sorter.is_active():
+            lReady = sorted(sorter.get_ready(), key=byName)
+            lDepths.append(lReady)
+            sorter.done(*lReady)
 
         if debug_output:
             print("%-78.78s" % ("OrderByDepends %s" % HASHDIVIDER))
-            print("\tlDepends", lsset(lDepends))
-            print("\tlProvides", lsset(lProvides))
-
-        count = 10
-        lP = set()
-        lDepends -= lP
-        lD = set(
-            list(
-                chain.from_iterable(
-                    [t.depends for t in lDepends if t.depends is not None]
-                )
-            )
-        )
-
-        while lDepends or lD or lP:
-            if debug_output:
-                print("%-78.78s" % ("lDepends loop %s" % DIVIDER))
-                print("\tlDepends", lsset(lDepends))
-                print("\tlD", lsset(lD))
-                print("\tlP", lsset(lP))
-
-            while lP and lP != lProvides:
-                if debug_output:
-                    print("\t--- lP", (lP), "\tlProvides", lProvides)
-                lProvides |= lP
-                lP = set(
-                    list(
-                        chain.from_iterable(
-                            [t.provides for t in lProvides if t.provides]
-                        )
-                    )
-                )
-                lP -= lProvides
-                lDepends -= lProvides
-                lD -= lProvides
-
-            l = set([t for t in lDepends if not t.depends or t.Depends() <= lProvides])
-            l &= lQueueSet
-            if l:
-                lAdd = list(l)
-                lAdd.sort()
-                lDepths.append(lAdd)
-                lDepends -= l
-                lProvides |= l
-
-            if debug_output:
-                print("\t--- lDepends", lDepends)
-            while lD and lD != lDepends:
-                if debug_output:
-                    print("\t--- lD", (lD))
-                lDepends |= lD
-                lD = set(
-                    list(
-                        chain.from_iterable(
-                            [t.depends for t in lDepends if t.depends is not None]
-                        )
-                    )
-                )
-                lD -= lDepends
-                lD -= lProvides
-
-            lP |= set(
-                list(chain.from_iterable([t.provides for t in lProvides if t.provides]))
-            )
-            lP -= lProvides
-
-            count -= 1
-            if not count:
-                break
-
-        if debug_output:
-            print("\tlD", lsset(lD))
-            print("\tlProvides", lsset(lProvides))
             print("%-78.78s" % ("lDepths %s" % DIVIDER))
             for i in lDepths:
                 print("\t%s" % i)
 
         lReturn = [
-            t for t in chain.from_iterable([t for t in lDepths]) if not t.IsAbstract()
+            t for lDepth in lDepths for t in lDepth if not t.is_abstract
         ]
         return lReturn
 
-    def Enqueue(self, lTargets, dProviders, debug_output=False):
+    def Enqueue(self, lTargets, dProviders=None, debug_output=False):
         """Analyze dependencies to determine a valid build order.
 
         Args:
-            lQueueSet (set of Target): A set of targets that have been queued for processing.
-            lProvides (set of Target): A set of targets that are known to provide certain functionality.
+            lTargets (iterable of Target): The requested targets, or None for the default target.
+            dProviders (dict, optional): Full providers keyed by target. Defaults to the map built by Initialize.
             debug_output (bool, optional): If True, print debugging information. Defaults to False.
 
         Returns:
@@ -397,51 +873,73 @@ class Builder:
                 - set of Target: Essential targets that were found during analysis.
                 - set of Target: All targets that have been fully provided by the current queue.
         """
-        if not lTargets:
-            default = None
-            if "default" in self.index:
-                default = self.index["default"]
+        if dProviders is None:
+            dProviders = self.dFullProviders
 
+        dIndex = self.index
+
+        if not lTargets:
+            default = dIndex.get("default")
             if default and default.depends:
                 lTargets = default.depends
                 # print("%-26.26s Attempting default build: %s" % (START, lTargets))
             else:
-                return False, lOutput
+                return False, set(), set(), set(), set()
 
         lTargetSet = set(lTargets)
         lEssentials = set()
 
         # If we're only dealing in actions, we not build essentials, i.e. if we're only doing "clean" targets
-        print("TARGET ESSENTIAL?", lTargets)
+        if debug_output:
+            print("TARGET ESSENTIAL?", lTargets)
         if len([i for i in lTargets if i.actions]) != len(lTargets):
             # Get "any" and "essential" targets accounted for
-            if "any" in self.index and self.index["any"].depends:
-                lTargetSet |= self.index["any"].depends
+            anyTarget = dIndex.get("any")
+            if anyTarget and anyTarget.depends:
+                lTargetSet |= anyTarget.depends
 
-            for essential in self.lEssentials:
-                lEssentials |= dProviders[essential]
+            if dProviders is self.dFullProviders:
+                lEssentials |= self.lEssentialProviders
+            else:
+                for essential in self.lEssentials:
+                    lEssentials |= dProviders.get(essential, _EMPTY)
 
         if debug_output:
             print("%-15.15s %s" % ("lTargetSet", lTargetSet))
 
+        # Only stat what this request can actually reach.
+        self.CheckTimeStamps(self.Reachable(lTargetSet | lEssentials))
+
+        # Every target is concrete and nothing stands in for anything else,
+        # so the plan is just the depends closure of the request.
+        if self.bPlainGraph and dProviders is self.dFullProviders:
+            lQueueSet = set(lTargetSet)
+            lStack = list(lTargetSet)
+            while lStack:
+                for d in lStack.pop().depends:
+                    if d not in lQueueSet:
+                        lQueueSet.add(d)
+                        lStack.append(d)
+            if debug_output:
+                print("%-15.15s %s" % ("lQueueSet", lsset(lQueueSet)))
+            return True, lQueueSet, set(), lEssentials, set(lQueueSet)
+
         lQueueSet = lTargetSet
-        lProvides = set(
-            list(chain.from_iterable([t.provides for t in lQueueSet if t.provides]))
-        )
-        lDepends = set(
-            list(chain.from_iterable([t.depends for t in lQueueSet if t.depends]))
-        )
-        lAbstracts = set([t for t in lQueueSet | lDepends if t.IsAbstract()])
+        lProvides = {p for t in lQueueSet for p in t.provides}
+        lDepends = {d for t in lQueueSet for d in t.depends}
+        lAbstracts = {t for t in lQueueSet | lDepends if t.is_abstract}
         lDepends |= lAbstracts
         lQueueSet -= lAbstracts
+        # lFullProvides is kept equal to lQueueSet | lProvides by updating it
+        # in place wherever either of those grows.
         lFullProvides = lQueueSet | lProvides
+        # The queue never holds abstracts, so only provides can add them here.
+        lProvidedAbstracts = {t for t in lProvides if t.is_abstract}
 
         # lD and lP act as sets of new additions for lDepends and lProvides, respectively.
         # They are looped over until emptied.
-        lD = set(list(chain.from_iterable([t.depends for t in lDepends if t.depends])))
-        lP = set(
-            list(chain.from_iterable([t.provides for t in lProvides if t.provides]))
-        )
+        lD = {d for t in lDepends for d in t.depends}
+        lP = {p for t in lProvides for p in t.provides}
 
         if debug_output:
             print("%-78.78s" % ("Enqueue %s" % HASHDIVIDER))
@@ -452,13 +950,9 @@ class Builder:
             print("%-15.15s %s" % ("lFullProvides", lsset(lFullProvides)))
 
         lChosenEssentials = lFullProvides & lEssentials
-        lChosenEssentials |= self.lEssentials & set(
-            list(
-                chain.from_iterable(
-                    [t.provides for t in lChosenEssentials if t.provides]
-                )
-            )
-        )
+        lChosenEssentials |= self.lEssentials & {
+            p for t in lChosenEssentials for p in t.provides
+        }
         lExcludedEssentials = lEssentials - lChosenEssentials
 
         if debug_output:
@@ -471,10 +965,17 @@ class Builder:
                 % (WHI, "lExcludedEssentials", NRM, lsset(lExcludedEssentials))
             )
 
-        # The counter shouldn't be needed, but preventing infinite loops in the case of malformed YAML is nice.
-        counter = 5
+        # Every productive pass queues at least one more target, so a valid
+        # graph settles within len(self.lTargets) passes.  The cap only guards
+        # against malformed YAML.
+        counter = len(self.lTargets) + 1
 
         lAddToQueue = set()
+        lQueued = _EMPTY
+
+        # lChosenEssentials is fixed from here on, so each abstract depend's
+        # eligible providers only need filtering once.
+        dCandidates = {}
 
         if debug_output:
             print("%-78.78s" % ("Enqueue lDepends loop %s" % HASHDIVIDER))
@@ -493,14 +994,9 @@ class Builder:
                 if debug_output:
                     print("\tlP loop", "lP", lsset(lP), "lProvides", lsset(lProvides))
                 lProvides |= lP
-                lFullProvides = lQueueSet | lProvides
-                lP = set(
-                    list(
-                        chain.from_iterable(
-                            [t.provides for t in lFullProvides if t.provides]
-                        )
-                    )
-                )
+                lFullProvides |= lP
+                lProvidedAbstracts |= {t for t in lP if t.is_abstract}
+                lP = {p for t in lFullProvides for p in t.provides}
                 lP -= lProvides
 
             if debug_output:
@@ -517,17 +1013,7 @@ class Builder:
                 if debug_output:
                     print("\tlD loop", "lD", lsset(lD), "lDepends", lsset(lDepends))
                 lDepends |= lD
-                lD = set(
-                    list(
-                        chain.from_iterable(
-                            [
-                                t.depends
-                                for t in lDepends
-                                if t.depends is not None or t.Depends() & lFullProvides
-                            ]
-                        )
-                    )
-                )
+                lD = {d for t in lDepends for d in t.depends}
                 lD -= lDepends
 
             if debug_output:
@@ -536,8 +1022,6 @@ class Builder:
                 )
                 print("%-80.80s" % DIVIDER)
 
-            lFullProvides = lQueueSet | lProvides
-
             if debug_output:
                 print("%-15.15s %s" % ("lQueueSet", lsset(lQueueSet)))
                 print("%-15.15s %s" % ("lDepends", lsset(lDepends)))
@@ -549,30 +1033,31 @@ class Builder:
                 lPP = set()
 
                 # If not abstract, or its dependencies satisfied, it can provide itself
-                # if not depend.IsAbstract() or depend.depends and depend.Depends() <= lFullProvides:
-                if depend.IsAbstract():
-                    if depend.depends and depend.Depends() <= lFullProvides:
-                        lPP |= set([depend])
+                # if not depend.is_abstract or depend.depends and depend.depends <= lFullProvides:
+                if depend.is_abstract:
+                    if depend.depends and depend.depends <= lFullProvides:
+                        lPP.add(depend)
                     # print('\t%sSeeking provider for %s:%s %s' % (MAG, repr(depend), NRM, lPP))
 
                     # Fetch the list of other targets that provide this
                     if depend in dProviders:
-                        lPP |= set(
-                            [
+                        lCandidates = dCandidates.get(depend)
+                        if lCandidates is None:
+                            lCandidates = dCandidates[depend] = {
                                 t
                                 for t in dProviders[depend]
-                                if not t.depends or (t.Depends() & lChosenEssentials)
-                            ]
-                        )
+                                if not t.depends or (t.depends & lChosenEssentials)
+                            }
+                        lPP |= lCandidates
 
                     # print('\t%sSeeking provider for %s:%s %s' % (MAG, repr(depend), NRM, lPP))
 
                     if len(lPP) > 1 and lEssentials & lPP:
-                        lPP -= lExcludedEssentials | lAbstracts
+                        lPP.difference_update(lExcludedEssentials, lAbstracts)
 
                     # print('\t%sSeeking provider for %s:%s %s' % (MAG, repr(depend), NRM, lPP))
                 elif depend not in lFullProvides:
-                    lPP |= set([depend])
+                    lPP.add(depend)
 
                 if not lPP:
                     continue
@@ -593,14 +1078,24 @@ class Builder:
                     continue
 
                 if len(lPP) != 1:
-                    lPP = set(
-                        [t for t in lPP if t.depends and t.Depends() & lFullProvides]
-                    )
-                    # print('\t%sSeeking provider for %s:%s %s' % (MAG, repr(depend), NRM, lPP))
-
-                if len(lPP) != 1:
-                    lPP = set([t for t in lPP if t.depends and t.Depends() & lQueueSet])
-                    # print('\t%sSeeking provider for %s:%s %s' % (MAG, repr(depend), NRM, lPP))
+                    # Prefer the sole candidate with a provided depend, else the
+                    # sole one with a queued depend.  lQueueSet is a subset of
+                    # lFullProvides, so one pass can count both.
+                    provided = queued = None
+                    nProvided = nQueued = 0
+                    for t in lPP:
+                        if t.depends & lFullProvides:
+                            provided = t
+                            nProvided += 1
+                            if t.depends & lQueueSet:
+                                queued = t
+                                nQueued += 1
+                    if nProvided == 1:
+                        lPP = {provided}
+                    elif nQueued == 1:
+                        lPP = {queued}
+                    else:
+                        lPP = set()
 
                 if len(lPP) == 1:
                     if debug_output:
@@ -623,15 +1118,13 @@ class Builder:
                 print("%-15.15s %s" % ("lProvides", lsset(lProvides)))
                 print("%-15.15s %s" % ("lFullProvides", lsset(lFullProvides)))
 
-            lAddToQueue |= set(
-                [
-                    t
-                    for t in lDepends
-                    if t.IsAbstract() == False
-                    and t not in lFullProvides
-                    and t.Depends() <= lFullProvides
-                ]
-            )
+            lAddToQueue |= {
+                t
+                for t in lDepends
+                if not t.is_abstract
+                and t not in lFullProvides
+                and t.depends <= lFullProvides
+            }
 
             if debug_output:
                 print("%-78.78s" % ("Enqueue final lAddToEqueue %s" % DIVIDER))
@@ -644,42 +1137,37 @@ class Builder:
             # Set logic to add to the queue and update sets accordingly
             if lAddToQueue:
                 # print('%s%-15.15s%s %s' % (CYN, 'lAddToQueue', NRM, lAddToQueue))
+                # Abstracts picked as providers stay depends, not queue entries.
+                lNewAbstracts = {t for t in lAddToQueue if t.is_abstract}
+                lAddToQueue -= lNewAbstracts
                 lQueueSet |= lAddToQueue
-                lAbstracts = set([t for t in lQueueSet | lDepends if t.IsAbstract()])
-                lQueueSet -= lAbstracts
-                lFullProvides |= lQueueSet
-                lDepends |= lAbstracts - lFullProvides
+                lFullProvides |= lAddToQueue
+                lDepends |= lNewAbstracts - lFullProvides
 
                 if lFullProvides:
-                    lDepends -= set(
-                        [
-                            t
-                            for t in lDepends
-                            if t.IsAbstract()
-                            and t.depends
-                            and t.Depends() <= lFullProvides
-                        ]
-                    )
+                    lDepends -= {
+                        t
+                        for t in lDepends
+                        if t.is_abstract and t.depends and t.depends <= lFullProvides
+                    }
 
+                lQueued = lAddToQueue
                 lAddToQueue = set()
             else:
+                lQueued = _EMPTY
                 counter = 0
 
-            lFullProvides |= lQueueSet | lProvides
-            lAbstracts = set([t for t in lFullProvides | lDepends if t.IsAbstract()])
-            lDepends -= lFullProvides | lQueueSet
+            lAbstracts = lProvidedAbstracts | {t for t in lDepends if t.is_abstract}
+            lDepends -= lFullProvides
 
             # Make sure lD and lP are only holding things we haven't picked up yet.
-            lP |= set(
-                list(chain.from_iterable([t.provides for t in lQueueSet if t.provides]))
-            )
+            # What earlier queue entries provide or depend on was picked up by
+            # the passes before, so only this pass's additions are walked.
+            lP |= {p for t in lQueued for p in t.provides}
             lP -= lFullProvides
 
-            lD |= set(
-                list(chain.from_iterable([t.depends for t in lQueueSet if t.depends]))
-            )
-            lD -= lDepends
-            lD -= lFullProvides
+            lD |= {d for t in lQueued for d in t.depends}
+            lD.difference_update(lDepends, lFullProvides)
 
             if debug_output:
                 print("%-15.15s %s" % ("lQueueSet", lsset(lQueueSet)))
@@ -697,13 +1185,11 @@ class Builder:
             if counter <= 0:
                 break
 
-        lDepends -= set(
-            [
-                t
-                for t in lDepends
-                if t.IsAbstract() and t.depends and t.Depends() <= lFullProvides
-            ]
-        )
+        lDepends -= {
+            t
+            for t in lDepends
+            if t.is_abstract and t.depends and t.depends <= lFullProvides
+        }
 
         if debug_output:
             print("%-80.80s" % (DIVIDER))
@@ -725,6 +1211,9 @@ class Target:
     # Instance methods
 
     def __init__(self, name, builder, params):
+        # Names key the index and are compared in every sort, so share them.
+        if isinstance(name, str):
+            name = sys.intern(name)
         self.name = name
         builder.index[name] = self
         builder.lTargets.append(self)
@@ -738,8 +1227,12 @@ class Target:
         self.actions = None
         self.clean = None
         self.mtime = None
+        self._resolved = None
+        self.is_abstract = None
+        self._abstract_depends = _EMPTY
+        self._nonabstract_depends = _EMPTY
 
-        if params and type(params) == dict:
+        if params and isinstance(params, dict):
             self.__dict__.update(params)
 
         # print('%s%-8s%s\t%s' % (YEL, 'INIT', NRM, str(self)))
@@ -748,7 +1241,8 @@ class Target:
     def FinalizeInit(self, builder):
         """
         This method finalizes the initialization for a Target instance. It ensures that
-        'depends' and 'provides' attributes are converted to sets if they are not already.
+        'depends' and 'provides' attributes are converted to frozensets of targets,
+        and expands the 'exists' path against the builder's config.
 
         Parameters:
             builder (object): The main build object containing targets indexed by name.
@@ -756,18 +1250,34 @@ class Target:
         Returns:
             None
         """
-        if self.depends and type(self.depends) != set:
-            self.depends = set(
-                [builder.index[i] for i in self.depends if i in builder.index]
-            )
+        dIndex = builder.index
 
-        if self.provides and type(self.provides) != set:
-            self.provides = set(
-                [builder.index[i] for i in self.provides if i in builder.index]
-            )
-        self.CheckTimeStamp(builder)
+        # Empty relations share one frozenset so the hot loops never test for None.
+        if not self.depends:
+            self.depends = _EMPTY
+        elif isinstance(self.depends, (set, frozenset)):
+            self.depends = frozenset(self.depends)
+        else:
+            # One lookup per name; unknown names come back None and are dropped.
+            self.depends = frozenset(filter(None, map(dIndex.get, self.depends)))
+
+        if not self.provides:
+            self.provides = _EMPTY
+        elif isinstance(self.provides, (set, frozenset)):
+            self.provides = frozenset(self.provides)
+        else:
+            self.provides = frozenset(filter(None, map(dIndex.get, self.provides)))
+
+        # The config is fixed once loaded, so expand the path a single time.
+        if self.exists:
+            try:
+                self._resolved = self.exists % builder.config
+            except (KeyError, TypeError, ValueError):
+                self._resolved = self.exists
 
     def __str__(self):
+        from pprint import pformat
+
         d = {k: v for (k, v) in self.__dict__.items() if k != "name" and v}
         return "%-36s %s" % (self.name, pformat(d, width=140))
 
@@ -782,13 +1292,13 @@ class Target:
             return [self.name]
         return self.layers
 
-    def CheckTimeStamp(self, builder):
+    def CheckTimeStamp(self):
         """
         This method checks the timestamp of a file associated with this target. If such an existing file exists, it updates the 'mtime' attribute to represent
         its modification time. It returns None if no such file exists.
 
-        Parameters:
-            builder (object): The main build object containing targets indexed by name.
+        The path is resolved against the config in FinalizeInit, so this only
+        touches the target's own state and is safe to call from worker threads.
 
         Returns:
             float or None: The timestamp of the file if it exists, otherwise None.
@@ -797,37 +1307,33 @@ class Target:
             if self.mtime:
                 return self.mtime
 
-            fileentry = self.exists
+            fileentry = self._resolved
             # print("Checking existence of", fileentry, "for", self.name)
-            if os.path.exists(fileentry):
-                # print ("%s exists" % (fileentry))
-                if self.check_mtime:
-                    self.mtime = os.stat(fileentry).st_mtime
-                else:
-                    self.mtime = 1.0
-                return self.mtime
+            try:
+                st = os.stat(fileentry)
+            except (OSError, ValueError):
+                return None
+
+            # print ("%s exists" % (fileentry))
+            if self.check_mtime:
+                self.mtime = st.st_mtime
+            else:
+                self.mtime = 1.0
+            return self.mtime
 
         return None
 
     def Depends(self):
-        if not self.depends:
-            return set()
-        return self.depends
+        return self.depends or _EMPTY
 
     def AbstractDepends(self):
-        if not self.depends:
-            return set()
-        return set([d for d in self.depends if d.IsAbstract()])
+        return self._abstract_depends
 
     def NonAbstractDepends(self):
-        if not self.depends:
-            return set()
-        return set([d for d in self.depends if not d.IsAbstract()])
+        return self._nonabstract_depends
 
     def Provides(self):
-        if not self.provides:
-            return set()
-        return self.provides
+        return self.provides or _EMPTY
 
     def IsAbstract(self):
         if self.exists or self.actions or self.layers:
@@ -840,21 +1346,31 @@ class Target:
 # Returns: True/False success code, list of string output
 def BuildCLI(options, args):
     builder = Builder()
+    builder.use_cache = not options.no_cache
+
+    dProviders = builder.Initialize(options.build, options.config)
 
     if options.json_output:
         return True, builder.JSONOutput()
 
-    dProviders = builder.Initialize(options.build, options.config)
-
     lTargets = None
     if len(args):
         lTargets = [builder.index[i] for i in args if i in builder.index]
-        print("%-22s Attempting build from %s: %s" % (START, options.build, args))
+        print(
+            "%-*s Attempting build from %s: %s"
+            % (11 + ESCAPES, START, options.build, args)
+        )
 
     elif "default" in builder.index and builder.index["default"].depends:
-        print("DEFAULT TARGETS:", pformat(builder.index["default"].depends))
-        lTargets = builder.index["default"].depends
-        print("%-22s Attempting build from %s: default" % (START, options.build))
+        lTargets = set(builder.index["default"].depends)
+        if options.debug_output:
+            from pprint import pformat
+
+            print("DEFAULT TARGETS:", pformat(lTargets))
+        print(
+            "%-*s Attempting build from %s: default"
+            % (11 + ESCAPES, START, options.build)
+        )
 
     if options.debug_output and builder.lEssentials:
         print("ESSENTIALS:")
@@ -864,8 +1380,48 @@ def BuildCLI(options, args):
             else:
                 print(repr(e))
 
+    # Plugins can derive targets from the filesystem, so their plans are
+    # never reused.  Everything else is a pure function of the input files.
+    if (
+        options.json_cache
+        and builder.use_cache
+        and not builder.plugin
+        and not options.debug_output
+    ):
+        from hashlib import sha1
+
+        key = list(builder._cacheKey(options.build, builder.sConfigFile))
+        key += list(args)
+        # Plan lines carry the color escapes, and widths padded around them.
+        key.append(bool(ESCAPES))
+        sPlanFile = os.path.join(
+            CACHE_DIR,
+            "plans",
+            "%s.json" % sha1(repr(key).encode("utf-8")).hexdigest(),
+        )
+        tPlan = ReadPlan(sPlanFile, key)
+        if tPlan is None:
+            tPlan = PlanBuild(builder, lTargets, dProviders)
+            WritePlan(sPlanFile, key, *tPlan)
+        return tPlan
+
+    return PlanBuild(builder, lTargets, dProviders, options.debug_output)
+
+
+def PlanBuild(builder, lTargets, dProviders, debug_output=False):
+    """Resolve lTargets into an ordered build plan.
+
+    Args:
+        builder (Builder): An initialized builder.
+        lTargets (iterable of Target): The requested targets, or None for the default target.
+        dProviders (dict): Full providers keyed by target.
+        debug_output (bool, optional): If True, print debugging information. Defaults to False.
+
+    Returns:
+        tuple: True/False success code, list of string output.
+    """
     result, lQueueSet, lAmbiguous, lEssentials, lFullProvides = builder.Enqueue(
-        lTargets, dProviders, options.debug_output
+        lTargets, dProviders, debug_output
     )
 
     if not result:
@@ -876,18 +1432,16 @@ def BuildCLI(options, args):
     lOutput.append("%-80.80s" % HASHDIVIDER)
     if lAmbiguous and len(lAmbiguous):
         lOutput.append(
-            "%-16s Can not resolve for %s based on targets %s"
-            % (ERROR, builder.lEssentials, lTargets)
+            "%-*s Can not resolve for %s based on targets %s"
+            % (5 + ESCAPES, ERROR, builder.lEssentials, lTargets)
         )
         lOutput.append("%-34s %s" % ("AMBIGUOUS", "POTENTIALLY PROVIDED BY"))
         for t in lAmbiguous:
             lProviders = []
             if t in dProviders:
-                lProviders = [p.name for p in dProviders[t]]
-                lProviders.sort()
+                lProviders = sorted({p.name for p in dProviders[t]})
             sCause = ""
-            if len(lProviders):
-                lProviders.sort()
+            if lProviders:
                 sCause = ", ".join(lProviders)
             elif not t.exists and not t.actions:
                 sCause = "No target, no possible providers"
@@ -896,7 +1450,8 @@ def BuildCLI(options, args):
         return False, lOutput
 
     lOutput.append(
-        "%-22s %-22s %-28s %s" % (SUCCESS, "", "FILE/DIR", "LAYERS TO WRITE")
+        "%-*s %-22s %-28s %s"
+        % (11 + ESCAPES, SUCCESS, "", "FILE/DIR", "LAYERS TO WRITE")
     )
 
     lOrdered = builder.OrderByDepends(lQueueSet, lEssentials)
@@ -931,32 +1486,30 @@ def BuildGUI(options, args):
 
 if __name__ == "__main__":
     import sys
-    from optparse import OptionParser
+    from argparse import ArgumentParser
 
-    usage = "usage: %prog [options] target layer1 layer2 layer3 ..."
-    args_parser = OptionParser(usage)
+    usage = "%(prog)s [options] target layer1 layer2 layer3 ..."
+    args_parser = ArgumentParser(usage=usage)
 
-    args_parser.add_option(
+    args_parser.add_argument(
         "-c",
         "--config",
         action="store",
         dest="config",
-        type="string",
         help="Specify JSON containing configuration details",
         default="yamake-config.yaml",
     )
 
-    args_parser.add_option(
+    args_parser.add_argument(
         "-b",
         "--build",
         action="store",
         dest="build",
-        type="string",
         help="Specify JSON containing a list of layers and build instructions",
         default="yamake.yaml",
     )
 
-    args_parser.add_option(
+    args_parser.add_argument(
         "-j",
         "--json-output",
         action="store_true",
@@ -965,7 +1518,7 @@ if __name__ == "__main__":
         default=False,
     )
 
-    args_parser.add_option(
+    args_parser.add_argument(
         "-y",
         "--yaml-output",
         action="store_true",
@@ -974,8 +1527,7 @@ if __name__ == "__main__":
         default=False,
     )
 
-    args_parser.add_option(
-        "",
+    args_parser.add_argument(
         "--debug",
         action="store_true",
         dest="debug_output",
@@ -983,27 +1535,55 @@ if __name__ == "__main__":
         default=False,
     )
 
-    args_parser.add_option(
+    args_parser.add_argument(
+        "--json-cache",
+        action="store_true",
+        dest="json_cache",
+        help="Reuse build plans cached in %s while the inputs are unchanged"
+        % CACHE_DIR,
+        default=False,
+    )
+
+    args_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        dest="no_cache",
+        help="Neither read nor write anything cached in %s" % CACHE_DIR,
+        default=False,
+    )
+
+    args_parser.add_argument(
+        "--color",
+        action="store",
+        dest="color",
+        choices=("auto", "always", "never"),
+        help="Colorize output: auto (the default) only when writing to a terminal",
+        default="auto",
+    )
+
+    args_parser.add_argument(
         "-l",
         "--layers",
         action="store",
         dest="layers",
-        type="string",
         help="Specify a layers directory",
         default=None,
     )
 
-    args_parser.add_option(
-        "",
+    args_parser.add_argument(
         "--repo",
         action="store",
-        dest="layers",
-        type="string",
+        dest="repo",
         help="Specify a git repo directory",
         default=None,
     )
 
-    (options, args) = args_parser.parse_args(sys.argv)
+    args_parser.add_argument("targets", nargs="*", help="Targets to build")
+
+    options = args_parser.parse_intermixed_args()
+
+    if options.color != "auto":
+        SetColor(options.color == "always")
 
     if not options.build and os.path.exists("yamake.yaml"):
         options.build = "yamake.yaml"
@@ -1012,7 +1592,7 @@ if __name__ == "__main__":
         print("%s not found." % options.build)
         sys.exit(1)
 
-    result, lOutput = BuildCLI(options, args[1:])
+    result, lOutput = BuildCLI(options, options.targets)
     print("\n".join(lOutput))
     if not result:
         sys.exit(1)